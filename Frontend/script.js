@@ -22,11 +22,23 @@ function initYoutubePage() {
     const videoPreviewDiv = document.getElementById('video-preview'); // Select the new div
     const container = document.querySelector('.container');
 
+    let prefetchedVideoId = null;
+
     // 1. LISTEN FOR URL INPUT TO SHOW VIDEO
     videoUrlInput.addEventListener('input', () => {
         const url = videoUrlInput.value.trim();
         const videoId = extractVideoID(url);
 
+        if (videoId && videoId !== prefetchedVideoId) {
+            // Start the transcript fetch while the user types the question
+            prefetchedVideoId = videoId;
+            fetch(`${API_BASE}/prefetch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ video_url: url })
+            }).catch(() => {});
+        }
+
         if (videoId) {
             // Embed the YouTube Iframe
             videoPreviewDiv.innerHTML = `
@@ -82,7 +94,7 @@ function initYoutubePage() {
             const response = await fetch(`${API_BASE}/main`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ video_url: videoUrl, question: question })
+                body: JSON.stringify({ video_url: videoUrl, question: question, echo: false })
             });
 
             if (!response.ok) throw new Error("Backend Error");
@@ -122,13 +134,7 @@ function initNotesPage() {
         addBtn.disabled = true;
 
         try {
-            const response = await fetch(`${API_BASE}/generate_notes_only`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ topic: topic })
-            });
-
-            const data = await response.json();
+            const data = await fetchTopicNotes(topic);
 
             const newNote = {
                 id: Date.now(),
@@ -148,6 +154,34 @@ function initNotesPage() {
         }
     });
 
+    // Helper: GET the notes for a topic, revalidating the copy we already have.
+    // The backend answers 304 with no body when its ETag still matches.
+    async function fetchTopicNotes(topic) {
+        const key = topic.toLowerCase().split(/\s+/).join(' ');
+        const cached = JSON.parse(localStorage.getItem('notesCache') || '{}');
+        const headers = {};
+        if (cached[key]) headers['If-None-Match'] = cached[key].etag;
+
+        const response = await fetch(
+            `${API_BASE}/generate_notes_only?topic=${encodeURIComponent(topic)}`,
+            { headers: headers }
+        );
+        if (response.status === 304 && cached[key]) {
+            return cached[key].data;
+        }
+        if (!response.ok) {
+            throw new Error(`server returned ${response.status}`);
+        }
+
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            cached[key] = { etag: etag, data: data };
+            localStorage.setItem('notesCache', JSON.stringify(cached));
+        }
+        return data;
+    }
+
     // Helper: Save to LocalStorage
     function saveNote(note) {
         const notes = JSON.parse(localStorage.getItem('userNotes') || '[]');
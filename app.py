@@ -1,10 +1,72 @@
-import streamlit as st 
+import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 
-BACKEND_URL = 'http://127.0.0.1:8000/main'
+BACKEND_BASE = 'http://127.0.0.1:8000'
+BACKEND_URL = f'{BACKEND_BASE}/main'
+BATCH_URL = f'{BACKEND_BASE}/main/batch'
+PREFETCH_URL = f'{BACKEND_BASE}/prefetch'
+# (connect, read) seconds, the read side covers transcript extraction plus the model
+REQUEST_TIMEOUT = (5, 180)
 
 st.set_page_config(page_title="YouTube Q&A", layout="centered")
 
+
+@st.cache_resource
+def get_session():
+    """One pooled HTTP session shared by every rerun and every user of this app."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def ask(video_url, question):
+    response = get_session().post(
+        BACKEND_URL,
+        json={'video_url': video_url,
+              'question': question,
+              'echo': False},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+class PartialBatchError(Exception):
+    """Some questions in a batch failed. Raised so st.cache_data doesn't keep the failures."""
+
+    def __init__(self, data):
+        super().__init__('some questions could not be answered')
+        self.data = data
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def ask_many(video_url, questions):
+    """Sends all questions in one request; the backend answers them concurrently over one transcript."""
+    response = get_session().post(
+        BATCH_URL,
+        json={'video_url': video_url, 'questions': list(questions)},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    data = response.json()
+    if any('error' in item for item in data['answers']):
+        raise PartialBatchError(data)
+    return data
+
+
+def show_answers(data):
+    for item in data['answers']:
+        st.subheader(item['question'])
+        if 'error' in item:
+            st.error(item['error'])
+        else:
+            st.write(item['answer'])
+
+
 st.title('Youtube video Q&A')
 st.write('Ask questions about any YouTube video!')
 
@@ -16,32 +78,48 @@ video_url = st.text_input(
 if video_url:
     st.video(video_url)
 
-question =st.text_input(
-    'enter your questions regarding the video',
-    placeholder='What is the main topic of the video?'
-)
+    # start the transcript fetch while the user is still typing the question
+    if st.session_state.get('prefetched_url') != video_url:
+        st.session_state['prefetched_url'] = video_url
+        try:
+            get_session().post(PREFETCH_URL, json={'video_url': video_url}, timeout=5)
+        except requests.RequestException:
+            pass
+
+mode = st.radio('Mode', ['Single question', 'Multiple questions'], horizontal=True)
+
+if mode == 'Single question':
+    question =st.text_input(
+        'enter your questions regarding the video',
+        placeholder='What is the main topic of the video?'
+    )
+    questions = [question] if question.strip() else []
+else:
+    questions_text = st.text_area(
+        'enter your questions regarding the video, one per line',
+        placeholder='What is the main topic of the video?\nWhat examples are given?'
+    )
+    questions = [q.strip() for q in questions_text.splitlines() if q.strip()]
 
 if st.button('Ask'):
-    if not video_url or not question:
+    if not video_url or not questions:
         st.error("Please provide both a YouTube video URL and a question.")
     else:
         with st.spinner('Processing your request...'):
             try:
-                response = requests.post(
-                    BACKEND_URL,
-                    json={'video_url': video_url, 
-                          'question': question}
-                )
-                if response.status_code == 200:
-                    data = response.json()
+                if len(questions) == 1:
+                    data = ask(video_url, questions[0])
                     if 'error' in data:
                         st.error(data['error'])
                     else:
                         st.subheader('Answer:')
                         st.write(data['answer'])
                 else:
-                    st.error(f"Error: Received status code {response.status_code}")
+                    try:
+                        show_answers(ask_many(video_url, tuple(questions)))
+                    except PartialBatchError as e:
+                        show_answers(e.data)
+            except requests.HTTPError as e:
+                st.error(f"Error: Received status code {e.response.status_code}")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
-
-                
\ No newline at end of file
@@ -1,16 +1,61 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from langchain.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from fastapi.middleware.gzip import GZipMiddleware
+import asyncio
+import contextvars
+import hashlib
 import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from yttranscriber import extract_youtube_transcript as get_youtube_transcript
-from yttranscriber import ask_questions as answer_question
-from yttranscriber import model 
-from notes import generate_questions, evaluate, total_evaluate, extract_weak_topics
+from yttranscriber import video_cache_key
+from yttranscriber import aask_questions as answer_question
+from notes import agenerate_questions, aevaluate, atotal_evaluate, weak_topic_list
+from cache import get_cache, cache_stats, normalize_text
+from notes_store import abuild_notes, NO_WEAK_TOPICS
+from hedging import call_with_deadline, StageTimeout, hedge_stats
+import profiler
+from profiler import stage
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# yt-dlp is blocking, so extractions get their own small pool instead of
+# competing with the sync routes for the default threadpool
+TRANSCRIPT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRANSCRIPT_WORKERS", "4")),
+    thread_name_prefix="yt-dlp",
+)
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+# responses smaller than this aren't worth the CPU to compress
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "20"))
+# /prefetch answers "busy" once this many prefetched extractions are in flight
+MAX_PREFETCHES = int(os.getenv("MAX_PREFETCHES", "4"))
+# seconds a prefetch is kept running with nobody waiting on it
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "120"))
+# question sets are shared between students asking for the same topics, so
+# they expire to keep handing out fresh sets
+QUESTIONS_CACHE_TTL = float(os.getenv("QUESTIONS_CACHE_TTL", "3600"))
+
+metrics = {
+    "cancelled_requests": Counter(),
+}
+
+transcript_cache = get_cache("transcripts")
+questions_cache = get_cache("questions")
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,12 +63,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # the notes page reads the ETag to revalidate with If-None-Match
+    expose_headers=["ETag"],
 )
 
+# brotli when the client accepts it and brotli-asgi is installed, gzip otherwise
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# only installed when turned on, so unprofiled deployments pay nothing for it
+if profiler.PROFILING_ENABLED:
+    app.add_middleware(profiler.ProfilingMiddleware)
+
 
 class MainRequest(BaseModel):
     video_url: str
     question: str
+    # set to False to get only the answer back, without video_url and question
+    echo: bool = True
+
+class BatchRequest(BaseModel):
+    video_url: str
+    questions: list[str]
 
 class TopicsRequest(BaseModel):
     user_topics: str
@@ -40,6 +103,29 @@ class FinalRequest(BaseModel):
 class NotesRequest(BaseModel):
     topic: str
 
+class PrefetchRequest(BaseModel):
+    video_url: str
+
+
+def conditional_json(http_request: Request, payload: dict) -> Response:
+    """
+    JSON response with an ETag over its body. GET requests whose If-None-Match
+    already has that ETag (or is "*") get an empty 304 instead.
+    The ETag is weak because the compression middleware sends different bytes
+    for the same body depending on Accept-Encoding.
+    """
+    response = JSONResponse(payload)
+    etag = 'W/"' + hashlib.sha1(response.body).hexdigest() + '"'
+    if http_request.method in ("GET", "HEAD"):
+        client_etags = [
+            tag.strip().removeprefix("W/")
+            for tag in http_request.headers.get("if-none-match", "").split(",")
+        ]
+        if "*" in client_etags or etag.removeprefix("W/") in client_etags:
+            return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 def parse_questions_to_list(questions_text: str):
     """
@@ -55,68 +141,256 @@ def parse_questions_to_list(questions_text: str):
             questions.append(clean_line)
     return questions
 
-def generate_notes_stateless(topics: str, focus_areas: str) -> str:
-    """
-    Re-implementation of make_notes from notes.py to be stateless.
-    It does not rely on the global 'memory' object.
-    """
-    prompt_template = """You are a exam bot for a university creating comprehensive study materials.
-    
-    Create detailed, exam-focused notes on: {topics} and if the user asks for short notes then make it short but still detailed. like flashcards
-    
-    PRIORITY FOCUS on these weak areas identified in the student's exam: {focus_areas}
-    
-    Structure:
-    1. Quick Summary of {topics}
-    2. DEEP DIVE into Weak Areas ({focus_areas}):
-       - Detailed explanations
-       - Common pitfalls/mistakes
-       - Step-by-step breakdowns
-    3. Exam Tips & Key Formulas
-    
-    Use bolding, bullet points, and clear headers."""
-    
-    prompt = PromptTemplate(
-        input_variables=['topics', 'focus_areas'],
-        template=prompt_template
-    )
-    chain = prompt | model | StrOutputParser()
-    return chain.invoke({'topics': topics, 'focus_areas': focus_areas})
+async def agenerate_notes_stateless(topics: str, focus_areas: list) -> str:
+    """
+    Stateless notes for the routes, assembled from the section cache in
+    notes_store. It does not rely on the global 'memory' object and is
+    cancellable mid-call.
+    """
+    return await abuild_notes(topics, focus_areas)
+
+
+class TranscriptFetch:
+    """
+    One in-flight yt-dlp extraction, shared by every request waiting on the
+    same video. It is only cancelled once nobody is waiting on it any more.
+    One started by /prefetch is kept for PREFETCH_TTL seconds first, so
+    /main has time to pick it up.
+    """
+
+    def __init__(self, key: str, video_url: str):
+        self.key = key
+        self.cancel_event = threading.Event()
+        self.waiters = 0
+        self.prefetched = False
+        self._expiry = None
+        loop = asyncio.get_running_loop()
+        # run in a copy of the starting request's context so its profile
+        # (if any) sees the yt-dlp stages
+        self.future = loop.run_in_executor(
+            TRANSCRIPT_EXECUTOR,
+            partial(contextvars.copy_context().run, self._extract, video_url)
+        )
+        self.future.add_done_callback(self._finished)
+
+    def _extract(self, video_url):
+        # runs on the executor, so the blocking cache write stays off the loop
+        transcript = get_youtube_transcript(video_url, self.cancel_event)
+        transcript_cache.set(self.key, transcript)
+        return transcript
+
+    def mark_prefetched(self):
+        if self.prefetched:
+            return
+        self.prefetched = True
+        self._expiry = asyncio.get_running_loop().call_later(PREFETCH_TTL, self._prefetch_expired)
+
+    def _prefetch_expired(self):
+        self.prefetched = False
+        self._expiry = None
+        if self.waiters == 0:
+            self.cancel()
+
+    def _finished(self, future):
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        # a cancelled fetch can finish after a newer one for the same video
+        # was registered, which must stay in place
+        if inflight_transcripts.get(self.key) is self:
+            del inflight_transcripts[self.key]
+        if not future.cancelled():
+            # retrieve it so a failed prefetch nobody awaited isn't logged as unhandled
+            future.exception()
+
+    def cancel(self):
+        # a queued extraction is dropped before it starts, a running one
+        # stops before downloading the caption file
+        self.cancel_event.set()
+        self.future.cancel()
+
+
+# video id -> TranscriptFetch, so /main attaches to a fetch /prefetch started
+inflight_transcripts = {}
+
+def start_transcript_fetch(video_url: str) -> TranscriptFetch:
+    key = video_cache_key(video_url)
+    fetch = inflight_transcripts.get(key)
+    if fetch is None or fetch.cancel_event.is_set():
+        fetch = TranscriptFetch(key, video_url)
+        inflight_transcripts[key] = fetch
+    return fetch
+
+async def fetch_transcript(video_url: str) -> str:
+    """
+    Returns the cached transcript, or waits on the extraction for this video
+    (starting it on TRANSCRIPT_EXECUTOR if nothing is in flight yet).
+    """
+    cached = await transcript_cache.aget(video_cache_key(video_url))
+    if cached is not None:
+        return cached
+
+    fetch = start_transcript_fetch(video_url)
+    fetch.waiters += 1
+    try:
+        with stage("transcript_wait"):
+            return await asyncio.shield(fetch.future)
+    except asyncio.CancelledError:
+        if fetch.waiters == 1 and not fetch.prefetched:
+            fetch.cancel()
+        raise
+    finally:
+        fetch.waiters -= 1
+
+
+async def run_until_disconnect(http_request: Request, route: str, coro):
+    """
+    Awaits `coro` while polling for the client going away. On disconnect the
+    work is cancelled, counted in metrics and the request ends with a 499.
+    """
+    task = asyncio.ensure_future(coro)
+    while True:
+        try:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+            metrics["cancelled_requests"][route] += 1
+            logger.info("Client disconnected, cancelled %s", route)
+            raise HTTPException(status_code=499, detail="Client disconnected")
 
 
 @app.get("/")
 def welcome(): 
     return {'message': 'University Exam Prep Backend is Running'}
 
-@app.post("/main")
-def main(request: MainRequest):
+@app.get("/metrics")
+def get_metrics():
+    report = {name: dict(counts) for name, counts in metrics.items()}
+    report["cache"] = cache_stats()
+    report["stages"] = hedge_stats()
+    return report
+
+def _check_admin(http_request: Request):
+    # the profiling surface doesn't exist unless it's turned on and guarded
+    if not profiler.PROFILING_ENABLED or not profiler.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.is_admin(http_request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profiles")
+def list_profiles(http_request: Request):
+    """The slowest profiled requests, slowest first, with their stage breakdowns."""
+    _check_admin(http_request)
+    return {"profiles": profiler.slowest_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, http_request: Request, format: str = "json"):
+    """One profile. format=folded returns the stack samples for flamegraph.pl/speedscope."""
+    _check_admin(http_request)
+    profile = profiler.find_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(profile.folded())
+    return {**profile.summary(), "folded_stacks": profile.folded()}
+
+@app.post("/prefetch")
+async def prefetch(request: PrefetchRequest):
     """
-    YouTube Transcription and Q&A Endpoint
+    Starts extracting the transcript as soon as the client has a video URL,
+    so by the time /main is called it is cached or already in flight.
     """
+    key = video_cache_key(request.video_url)
+    if await transcript_cache.aget(key) is not None:
+        return {"status": "ready"}
+    prefetching = sum(1 for fetch in inflight_transcripts.values() if fetch.prefetched)
+    if key not in inflight_transcripts and prefetching >= MAX_PREFETCHES:
+        return {"status": "busy"}
+    start_transcript_fetch(request.video_url).mark_prefetched()
+    return {"status": "pending"}
+
+async def _answer_from_video(request: MainRequest) -> str:
     try:
-        transcription_text = get_youtube_transcript(request.video_url)
+        transcription_text = await fetch_transcript(request.video_url)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Transcript extraction failed: {str(e)}")
 
     try:
-        answer = answer_question(transcription_text, request.question)
+        return await call_with_deadline(
+            "qa", lambda: answer_question(transcription_text, request.question)
+        )
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI processing failed: {str(e)}")
 
+@app.post("/main")
+async def main(request: MainRequest, http_request: Request):
+    """
+    YouTube Transcription and Q&A Endpoint
+    """
+    answer = await run_until_disconnect(http_request, "/main", _answer_from_video(request))
+
+    if not request.echo:
+        return {"answer": answer}
     return {
         "video_url": request.video_url,
         "question": request.question,
         "answer": answer
     }
 
-@app.post("/startsession")
-def start_session(request: TopicsRequest):
+async def _answer_batch(request: BatchRequest) -> list:
+    try:
+        transcription_text = await fetch_transcript(request.video_url)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Transcript extraction failed: {str(e)}")
+
+    async def answer_one(question):
+        # one slow or failed answer shouldn't sink the rest of the batch
+        try:
+            answer = await call_with_deadline(
+                "qa", lambda: answer_question(transcription_text, question)
+            )
+            return {"question": question, "answer": answer}
+        except StageTimeout as e:
+            return {"question": question, "error": str(e)}
+        except Exception as e:
+            return {"question": question, "error": f"AI processing failed: {str(e)}"}
+
+    return await asyncio.gather(*(answer_one(q) for q in request.questions))
+
+@app.post("/main/batch")
+async def main_batch(request: BatchRequest, http_request: Request):
     """
-    Generates exam questions based on topics.
-    Returns a list of questions for the frontend to manage.
+    Answers several questions about one video in a single round trip.
+    The transcript is resolved once and the questions are answered concurrently.
     """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+
+    answers = await run_until_disconnect(http_request, "/main/batch", _answer_batch(request))
+    return {"answers": answers}
+
+async def _question_set(user_topics: str) -> dict:
     try:
-        raw_response = generate_questions.invoke({'topics': request.user_topics})
+        key = normalize_text(user_topics)
+        raw_response = await questions_cache.aget(key)
+        if raw_response is None:
+            raw_response = await call_with_deadline(
+                "questions", lambda: agenerate_questions(user_topics), hedge=True
+            )
+            await questions_cache.aset(key, raw_response, ttl=QUESTIONS_CACHE_TTL)
         
         questions_list = parse_questions_to_list(raw_response)
         
@@ -124,58 +398,94 @@ def start_session(request: TopicsRequest):
             questions_list = [raw_response]
 
         return {
-            "session_id": "session_" + str(hash(request.user_topics)), 
+            # stable across workers and restarts, unlike hash()
+            "session_id": "session_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16], 
             "total_questions": len(questions_list),
             "questions": questions_list, 
-            "topics": request.user_topics
+            "topics": user_topics
         }
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate questions: {str(e)}")
 
+@app.post("/startsession")
+async def start_session(request: TopicsRequest, http_request: Request):
+    """
+    Generates exam questions based on topics.
+    Returns a list of questions for the frontend to manage.
+    """
+    return conditional_json(http_request, await _question_set(request.user_topics))
+
+@app.get("/startsession")
+async def start_session_cached(user_topics: str, http_request: Request):
+    """GET variant of /startsession so clients can revalidate with If-None-Match."""
+    return conditional_json(http_request, await _question_set(user_topics))
+
 @app.post("/submitanswer")
-def submit_answer(request: AnswerRequest):
+async def submit_answer(request: AnswerRequest):
     """
     Evaluates a single answer.
     """
     try:
-        evaluation_result = evaluate.invoke({
-            'question': request.question_text,
-            'answer': request.answer_text,
-            'topic': request.topic
-        })
+        evaluation_result = await call_with_deadline(
+            "grading",
+            lambda: aevaluate(request.question_text, request.answer_text, request.topic),
+            hedge=True,
+        )
         
         return {
             "evaluation": evaluation_result
         }
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
 
-@app.post("/finalevaluation")
-def final_evaluation(request: FinalRequest):
-    """
-    Generates the final report and study notes.
-    """
+async def _final_report(request: FinalRequest) -> dict:
     try:
-        total_eval_report = total_evaluate.invoke({
-            'conversation_history': request.full_conversation,
-            'topics': request.topics
-        })
-        weak_topics = extract_weak_topics(total_eval_report)
-        study_notes = generate_notes_stateless(request.topics, weak_topics)
+        total_eval_report = await call_with_deadline(
+            "report", lambda: atotal_evaluate(request.full_conversation, request.topics)
+        )
+        weak_topics = weak_topic_list(total_eval_report)
+        study_notes = await call_with_deadline(
+            "notes", lambda: agenerate_notes_stateless(request.topics, weak_topics)
+        )
         
         return {
             "total_evaluation": total_eval_report,
-            "weak_topics": weak_topics,
+            "weak_topics": ', '.join(weak_topics) or NO_WEAK_TOPICS,
             "notes": study_notes
         }
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Final evaluation failed: {str(e)}")
 
-@app.post("/generate_notes_only")
-def generate_notes_only(request: NotesRequest):
-    """Generates notes without an exam session"""
+@app.post("/finalevaluation")
+async def final_evaluation(request: FinalRequest, http_request: Request):
+    """
+    Generates the final report and study notes.
+    """
+    return await run_until_disconnect(http_request, "/finalevaluation", _final_report(request))
+
+async def _topic_notes(topic: str) -> dict:
     try:
-        notes = generate_notes_stateless(request.topic, "General Overview & Core Concepts")
-        return {"notes": notes, "topic": request.topic}
+        notes = await call_with_deadline(
+            "notes", lambda: agenerate_notes_stateless(topic, [])
+        )
+        return {"notes": notes, "topic": topic}
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Note generation failed: {str(e)}")
+
+@app.post("/generate_notes_only")
+async def generate_notes_only(request: NotesRequest, http_request: Request):
+    """Generates notes without an exam session"""
+    return conditional_json(http_request, await _topic_notes(request.topic))
+
+@app.get("/generate_notes_only")
+async def generate_notes_only_cached(topic: str, http_request: Request):
+    """GET variant of /generate_notes_only so clients can revalidate with If-None-Match."""
+    return conditional_json(http_request, await _topic_notes(topic))
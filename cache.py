@@ -0,0 +1,263 @@
+"""
+Cache shared by the backend routes.
+
+Every uvicorn worker gets its own in-memory tier, backed by one SQLite file
+(WAL mode) that all workers on the machine read and write. Values are stored
+zlib-compressed and both tiers evict least-recently-used entries once they go
+over their byte budget.
+
+Config (env):
+    EXAMBOT_CACHE_PATH       sqlite file for the shared tier, "" to disable it
+    EXAMBOT_CACHE_MEMORY_MB  per-worker memory budget
+    EXAMBOT_CACHE_DISK_MB    shared tier budget
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases and collapses whitespace so trivially different inputs share cache entries."""
+    return " ".join(text.lower().split())
+
+
+class CacheBackend:
+    """Interface for a cache tier. Keys are str, values are bytes."""
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """Per-process LRU bounded by the total size of the stored values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            if len(value) > self.max_bytes:
+                return
+            self._data[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache in a single SQLite file, safe to share between worker processes.
+    WAL mode lets readers in every worker run alongside a single writer.
+    """
+
+    # Only bump the LRU timestamp on read if it is older than this, so hot
+    # keys don't turn every read into a write
+    TOUCH_INTERVAL = 60
+    # Summing the table on every write is a full scan, so the size check only
+    # runs every EVICT_EVERY writes or once a sixteenth of the budget has
+    # been written since the last check
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writes_since_check = 0
+        self._bytes_since_check = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, accessed FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time()),
+        )
+        with self._write_lock:
+            self._writes_since_check += 1
+            self._bytes_since_check += len(value)
+            due = (
+                self._writes_since_check >= self.EVICT_EVERY
+                or self._bytes_since_check >= self.max_bytes // 16
+            )
+            if due:
+                self._writes_since_check = 0
+                self._bytes_since_check = 0
+        if due:
+            self._evict(conn)
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", doomed)
+
+
+class TieredCache(CacheBackend):
+    """Reads through the tiers in order and back-fills the faster ones on a hit."""
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+
+class Namespace:
+    """
+    A named slice of a backend holding JSON-serialisable values.
+    Keys can be anything json.dumps accepts and are hashed before storage.
+    """
+
+    def __init__(self, backend: CacheBackend, name: str):
+        self.backend = backend
+        self.name = name
+        self.stats = Counter()
+
+    def _key(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self.name}:{digest}"
+
+    def get(self, key):
+        raw = self.backend.get(self._key(key))
+        if raw is None:
+            self.stats["misses"] += 1
+            return None
+        entry = json.loads(zlib.decompress(raw))
+        if entry["expires"] is not None and entry["expires"] < time.time():
+            self.backend.delete(self._key(key))
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry["value"]
+
+    def set(self, key, value, ttl: float = None):
+        expires = time.time() + ttl if ttl is not None else None
+        entry = json.dumps({"value": value, "expires": expires}).encode("utf-8")
+        self.backend.set(self._key(key), zlib.compress(entry))
+
+    def delete(self, key):
+        self.backend.delete(self._key(key))
+
+    # The shared tier is a blocking SQLite call, so async code uses these to
+    # keep it off the event loop
+    async def aget(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value, ttl: float = None):
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+
+_backend = None
+_namespaces = {}
+_lock = threading.Lock()
+
+
+def _build_backend():
+    memory = MemoryCache(int(float(os.getenv("EXAMBOT_CACHE_MEMORY_MB", "32")) * 1024 * 1024))
+    path = os.getenv("EXAMBOT_CACHE_PATH", ".exambot_cache.sqlite3")
+    if not path:
+        return memory
+    disk = SQLiteCache(path, int(float(os.getenv("EXAMBOT_CACHE_DISK_MB", "256")) * 1024 * 1024))
+    return TieredCache(memory, disk)
+
+
+def get_cache(name: str) -> Namespace:
+    """Returns the namespace `name` on the process-wide backend, creating both lazily."""
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = _build_backend()
+        if name not in _namespaces:
+            _namespaces[name] = Namespace(_backend, name)
+        return _namespaces[name]
+
+
+def cache_stats() -> dict:
+    return {name: dict(ns.stats) for name, ns in _namespaces.items()}
@@ -0,0 +1,156 @@
+"""
+Picks which caption track to download for a video and parses it.
+
+Tracks are ranked manual before auto, exact language before regional variant
+(en before en-US/en-GB), then fall back to whatever manual track the video has
+or the auto captions in its original spoken language. Within a track the
+smallest format we can parse is used.
+"""
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse, parse_qs
+
+CAPTION_LANGUAGES = [
+    lang.strip() for lang in os.getenv("EXAMBOT_CAPTION_LANGS", "en").split(",") if lang.strip()
+]
+
+# Smallest first. Auto-caption vtt repeats every rolling line twice, so for
+# auto tracks srv3/json3 usually come out smaller.
+FORMAT_PREFERENCE = {
+    "manual": ("vtt", "srv3", "json3"),
+    "auto": ("srv3", "json3", "vtt"),
+}
+
+
+def parse_json3(raw):
+    data = json.loads(raw)
+    segments = []
+    for event in data.get("events", []):
+        text = " ".join(seg.get("utf8", "").strip() for seg in event.get("segs", [])).strip()
+        if text:
+            segments.append((event.get("tStartMs", 0), text))
+    return segments
+
+
+def parse_srv3(raw):
+    root = ET.fromstring(raw)
+    segments = []
+    for p in root.iter("p"):
+        text = " ".join("".join(p.itertext()).split())
+        if text:
+            segments.append((int(p.get("t", 0)), text))
+    return segments
+
+
+_VTT_TIMING = re.compile(r"(?:(\d+):)?(\d{2}):(\d{2})\.(\d{3})\s+-->")
+_VTT_TAG = re.compile(r"<[^>]+>")
+
+
+def parse_vtt(raw, dedup=False):
+    """
+    `dedup` drops a line that repeats the one before it, for auto captions
+    which carry the previous line over into the next cue. Manual tracks can
+    legitimately repeat a line, so they keep every one.
+    """
+    segments = []
+    last_line = None
+    # cues are blank-line separated blocks: an optional identifier, the timing
+    # line, then the text. Blocks without a timing line are the header or
+    # NOTE/STYLE/REGION blocks and carry no captions.
+    for block in re.split(r"\r?\n[ \t]*\r?\n", raw):
+        lines = block.splitlines()
+        timing = next((i for i, line in enumerate(lines) if _VTT_TIMING.match(line)), None)
+        if timing is None:
+            continue
+        h, m, s, ms = _VTT_TIMING.match(lines[timing]).groups()
+        start_ms = ((int(h or 0) * 60 + int(m)) * 60 + int(s)) * 1000 + int(ms)
+        for line in lines[timing + 1:]:
+            text = " ".join(_VTT_TAG.sub("", line).split())
+            if not text or (dedup and text == last_line):
+                continue
+            segments.append((start_ms, text))
+            last_line = text
+    return segments
+
+
+PARSERS = {
+    "json3": parse_json3,
+    "srv3": parse_srv3,
+    "vtt": parse_vtt,
+}
+
+
+def _language_rank(lang, languages):
+    """
+    (position in `languages`, 0 for an exact match or 1 for a regional
+    variant), or None if the language isn't wanted.
+    """
+    lang = lang.removesuffix("-orig")
+    if lang in languages:
+        return (languages.index(lang), 0)
+    base = lang.split("-")[0]
+    if base in languages:
+        return (languages.index(base), 1)
+    return None
+
+
+def _pick_format(formats, kind):
+    by_ext = {fmt.get("ext"): fmt for fmt in formats if fmt.get("url")}
+    for ext in FORMAT_PREFERENCE[kind]:
+        if ext in by_ext:
+            return ext, by_ext[ext]["url"]
+    return None
+
+
+def rank_tracks(info, languages=None):
+    """All parseable caption tracks in `info`, best first."""
+    languages = languages or CAPTION_LANGUAGES
+    ranked = []
+    sources = (
+        ("manual", info.get("subtitles") or {}),
+        ("auto", info.get("automatic_captions") or {}),
+    )
+    for kind_rank, (kind, tracks) in enumerate(sources):
+        for lang, formats in tracks.items():
+            picked = _pick_format(formats, kind)
+            if picked is None:
+                continue
+            lang_rank = _language_rank(lang, languages)
+            if lang_rank is not None:
+                rank = (0, kind_rank, *lang_rank)
+            elif kind == "manual":
+                rank = (1, 0, 0, 0)
+            elif lang.endswith("-orig"):
+                # auto captions in the language actually spoken in the video
+                rank = (1, 1, 0, 0)
+            else:
+                # machine translations of the auto captions
+                continue
+            ext, url = picked
+            ranked.append((rank, {"kind": kind, "lang": lang, "ext": ext, "url": url}))
+    ranked.sort(key=lambda item: item[0])
+    return [track for _, track in ranked]
+
+
+def resolve_caption_track(info, languages=None):
+    tracks = rank_tracks(info, languages)
+    if not tracks:
+        raise ValueError("No subtitles found")
+    return tracks[0]
+
+
+def track_ttl(track, default=3600):
+    """Seconds the track's signed URL stays valid, with a minute of margin."""
+    expire = parse_qs(urlparse(track["url"]).query).get("expire", [None])[0]
+    if expire is None or not expire.isdigit():
+        return default
+    return int(expire) - time.time() - 60
+
+
+def parse_captions(track, raw):
+    if track["ext"] == "vtt":
+        return parse_vtt(raw, dedup=track["kind"] == "auto")
+    return PARSERS[track["ext"]](raw)
@@ -0,0 +1,131 @@
+"""
+Per-stage deadlines and hedged calls for the model.
+
+Every model call in the backend goes through call_with_deadline with a stage
+name, which bounds it by that stage's timeout. Short idempotent stages
+(grading, question generation) can also be hedged: if the call is still
+running after the stage's observed p95 latency, a duplicate is fired and
+whichever answers first wins. Hedges are capped at a fraction of the calls
+made for that stage so they can't add more than that much extra load.
+
+Config (env):
+    EXAMBOT_TIMEOUT_<STAGE>   seconds, e.g. EXAMBOT_TIMEOUT_GRADING=20
+    EXAMBOT_HEDGING           "1" to turn hedging on
+    EXAMBOT_HEDGE_MAX_RATIO   max hedges per call over the last 200 calls, default 0.1
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from profiler import stage as profile_stage
+
+DEFAULT_TIMEOUTS = {
+    "grading": 30,
+    "questions": 45,
+    "qa": 60,
+    "report": 90,
+    "notes": 120,
+}
+
+HEDGING_ENABLED = os.getenv("EXAMBOT_HEDGING", "0") == "1"
+HEDGE_MAX_RATIO = float(os.getenv("EXAMBOT_HEDGE_MAX_RATIO", "0.1"))
+
+
+class StageTimeout(Exception):
+    """Raised when a stage runs past its deadline."""
+
+
+def stage_timeout(stage: str) -> float:
+    return float(os.getenv(f"EXAMBOT_TIMEOUT_{stage.upper()}", DEFAULT_TIMEOUTS[stage]))
+
+
+class HedgePolicy:
+    """Latency window for one stage plus the budget for hedging it."""
+
+    def __init__(self, max_ratio: float, window: int = 200, min_samples: int = 20):
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.window = window
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        # call numbers that fired a hedge, so the budget only counts the
+        # last `window` calls and quiet periods can't be saved up for a burst
+        self.hedged_calls = deque()
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self):
+        """p95 of recent latencies, or None until there are enough samples to trust it."""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[math.ceil(len(ordered) * 0.95) - 1]
+
+    def try_acquire(self) -> bool:
+        while self.hedged_calls and self.hedged_calls[0] <= self.calls - self.window:
+            self.hedged_calls.popleft()
+        if len(self.hedged_calls) + 1 > self.max_ratio * min(self.calls, self.window):
+            return False
+        self.hedged_calls.append(self.calls)
+        self.hedges += 1
+        return True
+
+
+policies = {stage: HedgePolicy(HEDGE_MAX_RATIO) for stage in DEFAULT_TIMEOUTS}
+
+
+async def _hedged(policy: HedgePolicy, make_call):
+    tasks = [asyncio.ensure_future(make_call())]
+    try:
+        delay = policy.p95()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and policy.try_acquire():
+                tasks.append(asyncio.ensure_future(make_call()))
+
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_deadline(stage: str, make_call, hedge: bool = False):
+    """
+    Awaits make_call() within the stage's deadline. `make_call` must return a
+    fresh awaitable each time it is called, since a hedge calls it twice.
+    """
+    policy = policies[stage]
+    policy.calls += 1
+    timeout = stage_timeout(stage)
+    start = time.monotonic()
+    try:
+        with profile_stage(f"model:{stage}"):
+            if hedge and HEDGING_ENABLED:
+                result = await asyncio.wait_for(_hedged(policy, make_call), timeout)
+            else:
+                result = await asyncio.wait_for(make_call(), timeout)
+    except asyncio.TimeoutError:
+        # a hang is exactly the tail p95 has to see
+        policy.record(time.monotonic() - start)
+        raise StageTimeout(f"{stage} took longer than {timeout:g}s")
+    policy.record(time.monotonic() - start)
+    return result
+
+
+def hedge_stats() -> dict:
+    return {
+        stage: {"calls": policy.calls, "hedges": policy.hedges, "p95": policy.p95()}
+        for stage, policy in policies.items()
+    }
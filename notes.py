@@ -1,10 +1,10 @@
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
 # from langchain.memory import ConversationBufferMemory
 # from langchain_core.pydantic_v1 import BaseModel, Field
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
 from yttranscriber import model
+from notes_store import build_notes, NO_WEAK_TOPICS
 
 # memory = ConversationBufferMemory(
 #     memory_key="chat_history",
@@ -16,12 +16,9 @@ from yttranscriber import model
 class QuestionGeneration(BaseModel):
     topics: str = Field(description="The topics provided by the user to generate questions from")
 
-@tool("generate_questions", args_schema=QuestionGeneration)
-def generate_questions(topics: str) -> str:
-    """Generate university exam questions based on the topics provided by the user."""
-    prompt = PromptTemplate(
-        input_variables=['topics'],
-        template="""You are a university professor preparing examination questions.
+QUESTIONS_PROMPT = PromptTemplate(
+    input_variables=['topics'],
+    template="""You are a university professor preparing examination questions.
         
         Generate EXACTLY 15 examination questions based on these topics: {topics}
         
@@ -34,23 +31,30 @@ def generate_questions(topics: str) -> str:
         
         Format as a numbered list (1-15).
         Make questions challenging but fair for comprehensive exam preparation."""
-    )
-    chain = prompt | model
+)
+
+@tool("generate_questions", args_schema=QuestionGeneration)
+def generate_questions(topics: str) -> str:
+    """Generate university exam questions based on the topics provided by the user."""
+    chain = QUESTIONS_PROMPT | model
     response = chain.invoke({'topics': topics})
     return response.content
 
+async def agenerate_questions(topics: str) -> str:
+    """Async version of generate_questions, raises on failure."""
+    chain = QUESTIONS_PROMPT | model
+    response = await chain.ainvoke({'topics': topics})
+    return response.content
+
 
 class AnswerEvaluation(BaseModel):
     question: str = Field(description="The question asked")
     answer: str = Field(description="The answer given by the candidate")
     topic: str = Field(description="The topic being tested")
 
-@tool("evaluate_answer", args_schema=AnswerEvaluation)
-def evaluate(question: str, answer: str, topic: str) -> str:
-    """Evaluate the answer from university examination perspective. Rate from 1-10."""
-    prompt = PromptTemplate(
-        input_variables=['question', 'answer', 'topic'],
-        template="""You are a university professor evaluating exam answers for final grading.
+EVALUATE_PROMPT = PromptTemplate(
+    input_variables=['question', 'answer', 'topic'],
+    template="""You are a university professor evaluating exam answers for final grading.
         
         Topic: {topic}
         Question: {question}
@@ -69,22 +73,29 @@ def evaluate(question: str, answer: str, topic: str) -> str:
         Strong Points: ...
         Weak Points: ...
         Expected Elements: ..."""
-    )
-    chain = prompt | model
+)
+
+@tool("evaluate_answer", args_schema=AnswerEvaluation)
+def evaluate(question: str, answer: str, topic: str) -> str:
+    """Evaluate the answer from university examination perspective. Rate from 1-10."""
+    chain = EVALUATE_PROMPT | model
     response = chain.invoke({'question': question, 'answer': answer, 'topic': topic})
     return response.content
 
+async def aevaluate(question: str, answer: str, topic: str) -> str:
+    """Async version of evaluate, raises on failure."""
+    chain = EVALUATE_PROMPT | model
+    response = await chain.ainvoke({'question': question, 'answer': answer, 'topic': topic})
+    return response.content
+
 
 class TotalReview(BaseModel):
     conversation_history: str = Field(description="The full Q&A conversation history")
     topics: str = Field(description="The topics covered")
 
-@tool("total_review", args_schema=TotalReview)
-def total_evaluate(conversation_history: str, topics: str) -> str:
-    """Evaluate overall exam performance and identify weak topics for targeted preparation."""
-    prompt = PromptTemplate(
-        input_variables=['conversation_history', 'topics'],
-        template="""You are a university professor providing comprehensive exam performance feedback.
+TOTAL_REVIEW_PROMPT = PromptTemplate(
+    input_variables=['conversation_history', 'topics'],
+    template="""You are a university professor providing comprehensive exam performance feedback.
         
         TOPICS COVERED: {topics}
         
@@ -106,83 +117,39 @@ def total_evaluate(conversation_history: str, topics: str) -> str:
         - Specific Topic/Concept 3
         
         Be encouraging but honest - this is to help the student prepare better."""
-    )
-    chain = prompt | model
+)
+
+@tool("total_review", args_schema=TotalReview)
+def total_evaluate(conversation_history: str, topics: str) -> str:
+    """Evaluate overall exam performance and identify weak topics for targeted preparation."""
+    chain = TOTAL_REVIEW_PROMPT | model
     response = chain.invoke({'conversation_history': conversation_history, 'topics': topics})
     return response.content
 
+async def atotal_evaluate(conversation_history: str, topics: str) -> str:
+    """Async version of total_evaluate, so the backend can cancel it mid-call."""
+    chain = TOTAL_REVIEW_PROMPT | model
+    response = await chain.ainvoke({'conversation_history': conversation_history, 'topics': topics})
+    return response.content
+
 
 class NoteGeneration(BaseModel):
     topics: str = Field(description="Topics to generate notes for")
-    focus_areas: str = Field(default="", description="Specific areas to focus on")
+    focus_areas: list[str] = Field(default_factory=list, description="Specific areas to focus on")
 
-def make_notes(topics: str, focus_areas: str = "") -> str:
+def make_notes(topics: str, focus_areas=()) -> str:
     """Generate comprehensive study notes optimized for university exam preparation."""
     try:
-        if focus_areas:
-            prompt_text = f"""You are a university professor creating comprehensive study materials for exam preparation.
-            
-            Create detailed, exam-focused notes on: {topics}
-            
-            PRIORITY FOCUS on these weak areas: {focus_areas}
-            
-            For the weak areas (MOST IMPORTANT - cover extensively):
-            - Clear, detailed explanations of core concepts
-            - Step-by-step breakdowns of complex ideas
-            - Common exam questions on these topics
-            - Common mistakes students make and how to avoid them
-            - Key formulas, definitions, or frameworks (if applicable)
-            - Practice tips and memory aids
-            - Real-world applications and examples
-            
-            For other topics (standard coverage):
-            - Essential concepts and definitions
-            - Important points to remember
-            - Quick reference points
-            
-            Use university-level depth with clear formatting:
-            - Bold for critical terms and concepts
-            - Bullet points for key facts
-            - Numbered steps for procedures/processes
-            - Examples marked clearly
-            - "EXAM TIP:" for exam-specific advice
-            
-            Make this comprehensive enough for thorough exam preparation."""
-        else:
-            prompt_text = f"""You are a university professor creating comprehensive study materials for exam preparation.
-            
-            Create detailed, exam-focused notes on: {topics}
-            
-            Include:
-            - Core concepts and definitions
-            - Key theories and frameworks
-            - Important formulas or principles
-            - Common exam questions
-            - Practice tips and examples
-            
-            Use university-level depth with clear formatting:
-            - Bold for critical terms
-            - Bullet points for key facts
-            - Numbered steps for procedures
-            - "EXAM TIP:" for exam-specific advice"""
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a university professor creating comprehensive exam preparation materials. Focus on clarity, depth, and exam readiness."),
-            ("human", prompt_text)
-        ])
-
-        chain = prompt | model | StrOutputParser()
-
-        response = chain.invoke({})
-
-        return response
+        # base notes and weak-area sections come from the shared notes store,
+        # only the sections that aren't cached yet hit the model
+        return build_notes(topics, focus_areas)
 
     except Exception as e:
         return f"Error occurred: {e}"
 
 
-def extract_weak_topics(evaluation_text: str) -> str:
-    """Extract weak topics from the evaluation text."""
+def weak_topic_list(evaluation_text: str) -> list:
+    """Extract weak topics from the evaluation text, one entry per listed topic."""
     lines = evaluation_text.split('\n')
     weak_topics = []
     capture = False
@@ -196,7 +163,13 @@ def extract_weak_topics(evaluation_text: str) -> str:
         elif capture and line.strip() and not line.strip().startswith('-'):
             break
     
-    return ', '.join(weak_topics) if weak_topics else "general concepts"
+    return weak_topics
+
+
+def extract_weak_topics(evaluation_text: str) -> str:
+    """Weak topics from the evaluation text as one readable string."""
+    weak_topics = weak_topic_list(evaluation_text)
+    return ', '.join(weak_topics) if weak_topics else NO_WEAK_TOPICS
 
 
 def run_qa_session():
@@ -289,8 +262,8 @@ def run_qa_session():
     print(total_eval)
     
     # Step 5: Extract weak topics
-    weak_topics = extract_weak_topics(total_eval)
-    print(f"\n🎯 Weak areas identified: {weak_topics}")
+    weak_topics = weak_topic_list(total_eval)
+    print(f"\n🎯 Weak areas identified: {', '.join(weak_topics) or NO_WEAK_TOPICS}")
     print("⏳ Creating comprehensive notes with focus on your weak areas...")
     
     focused_notes = make_notes(topics, weak_topics)
@@ -0,0 +1,127 @@
+"""
+Study notes assembled from cached sections.
+
+The base notes for a topic (summary, core concepts, exam tips) are the same
+for every student, so they are cached once per normalized topic. Each weak
+area gets its own deep-dive section cached per (topic, weak area). A request
+only sends the sections nobody has asked for yet to the model.
+"""
+import asyncio
+import os
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from yttranscriber import model
+from cache import get_cache, normalize_text
+
+# Focus string used by /generate_notes_only, means "no weak areas, base notes only"
+GENERAL_FOCUS = "General Overview & Core Concepts"
+# What notes.extract_weak_topics reports when the evaluation listed no weak topics
+NO_WEAK_TOPICS = "general concepts"
+# how many missing sections one request may generate at once
+MAX_CONCURRENT_SECTIONS = int(os.getenv("MAX_CONCURRENT_SECTIONS", "4"))
+
+BASE_NOTES_PROMPT = PromptTemplate(
+    input_variables=['topics'],
+    template="""You are a exam bot for a university creating comprehensive study materials.
+
+    Create detailed, exam-focused notes on: {topics} and if the user asks for short notes then make it short but still detailed. like flashcards
+
+    Structure:
+    1. Quick Summary of {topics}
+    2. Core Concepts & Definitions
+    3. Exam Tips & Key Formulas
+
+    Use bolding, bullet points, and clear headers."""
+)
+
+DEEP_DIVE_PROMPT = PromptTemplate(
+    input_variables=['topics', 'weak_area'],
+    template="""You are a exam bot for a university creating comprehensive study materials.
+
+    A student studying {topics} is weak on: {weak_area}
+
+    Write a DEEP DIVE section on {weak_area} only, starting with a "### {weak_area}" header:
+       - Detailed explanations
+       - Common pitfalls/mistakes
+       - Step-by-step breakdowns
+
+    Do not repeat a general summary of {topics}. Use bolding and bullet points."""
+)
+
+base_notes_cache = get_cache("notes_base")
+section_cache = get_cache("notes_sections")
+
+
+_PLACEHOLDERS = {normalize_text(GENERAL_FOCUS), normalize_text(NO_WEAK_TOPICS)}
+
+
+def unique_focus_areas(focus_areas) -> list:
+    """Drops duplicate and blank weak areas along with the "no weak areas" placeholders."""
+    areas = []
+    seen = set()
+    for area in focus_areas:
+        area = area.strip()
+        key = normalize_text(area)
+        if not key or key in _PLACEHOLDERS or key in seen:
+            continue
+        seen.add(key)
+        areas.append(area)
+    return areas
+
+
+def _assemble(base: str, sections: list) -> str:
+    if not sections:
+        return base
+    return base + "\n\n## Deep Dive into Weak Areas\n\n" + "\n\n".join(sections)
+
+
+def build_notes(topics: str, focus_areas=()) -> str:
+    """Returns notes for `topics` with a deep dive on each weak area, generating only what isn't cached."""
+    topic_key = normalize_text(topics)
+
+    base = base_notes_cache.get(topic_key)
+    if base is None:
+        base = (BASE_NOTES_PROMPT | model | StrOutputParser()).invoke({'topics': topics})
+        base_notes_cache.set(topic_key, base)
+
+    sections = []
+    for area in unique_focus_areas(focus_areas):
+        key = [topic_key, normalize_text(area)]
+        section = section_cache.get(key)
+        if section is None:
+            section = (DEEP_DIVE_PROMPT | model | StrOutputParser()).invoke(
+                {'topics': topics, 'weak_area': area}
+            )
+            section_cache.set(key, section)
+        sections.append(section)
+
+    return _assemble(base, sections)
+
+
+async def abuild_notes(topics: str, focus_areas=()) -> str:
+    """Async version of build_notes. Missing sections are generated concurrently."""
+    topic_key = normalize_text(topics)
+    areas = unique_focus_areas(focus_areas)
+    slots = asyncio.Semaphore(MAX_CONCURRENT_SECTIONS)
+
+    async def base_notes():
+        base = await base_notes_cache.aget(topic_key)
+        if base is None:
+            base = await (BASE_NOTES_PROMPT | model | StrOutputParser()).ainvoke({'topics': topics})
+            await base_notes_cache.aset(topic_key, base)
+        return base
+
+    async def deep_dive(area):
+        key = [topic_key, normalize_text(area)]
+        section = await section_cache.aget(key)
+        if section is None:
+            async with slots:
+                section = await (DEEP_DIVE_PROMPT | model | StrOutputParser()).ainvoke(
+                    {'topics': topics, 'weak_area': area}
+                )
+            await section_cache.aset(key, section)
+        return section
+
+    base, *sections = await asyncio.gather(base_notes(), *(deep_dive(area) for area in areas))
+    return _assemble(base, sections)
@@ -0,0 +1,219 @@
+"""
+Opt-in request profiling for the backend.
+
+With EXAMBOT_PROFILING=1 a request is profiled when it carries the
+`X-Exambot-Profile: 1` header along with a valid `X-Admin-Token`, or gets
+picked by EXAMBOT_PROFILE_SAMPLE_RATE. A profiled request records how long
+each stage() took, and the worker threads running its blocking stages are
+sampled into folded stacks (the format flamegraph.pl and speedscope read).
+The event loop thread is never sampled: it is shared by every in-flight
+request, so its stacks can't be attributed to one of them. Time spent there
+shows up in the stage timings instead. The slowest EXAMBOT_PROFILE_SLOTS
+profiles are kept in memory for the admin endpoints in backend2.
+
+With profiling off the middleware isn't installed and stage() costs a single
+ContextVar lookup.
+"""
+import asyncio
+import contextvars
+import heapq
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+
+PROFILING_ENABLED = os.getenv("EXAMBOT_PROFILING", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("EXAMBOT_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOTS = int(os.getenv("EXAMBOT_PROFILE_SLOTS", "20"))
+SAMPLE_INTERVAL = float(os.getenv("EXAMBOT_PROFILE_INTERVAL_MS", "10")) / 1000
+PROFILE_HEADER = b"x-exambot-profile"
+ADMIN_TOKEN = os.getenv("EXAMBOT_ADMIN_TOKEN", "")
+
+_current = contextvars.ContextVar("exambot_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, route: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.started = time.time()
+        self.duration = None
+        self.stages = []
+        self.stacks = Counter()
+        # worker thread ident -> how many of this request's stages are running on it
+        self.threads = Counter()
+
+    def enter_thread(self, ident):
+        with _lock:
+            self.threads[ident] += 1
+
+    def leave_thread(self, ident):
+        with _lock:
+            self.threads[ident] -= 1
+            if self.threads[ident] <= 0:
+                del self.threads[ident]
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "started": self.started,
+            "duration": self.duration,
+            "stages": self.stages,
+        }
+
+    def folded(self) -> str:
+        with _lock:
+            stacks = self.stacks.most_common()
+        return "\n".join(f"{stack} {count}" for stack, count in stacks)
+
+
+_lock = threading.Lock()
+_active = set()
+_sampler = None
+_slowest = []  # min-heap of (duration, seq, profile)
+_recent = deque(maxlen=PROFILE_SLOTS)
+_seq = itertools.count()
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_loop():
+    global _sampler
+    while True:
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            wanted = [(profile, list(profile.threads)) for profile in _active]
+        frames = sys._current_frames()
+        samples = [
+            (profile, _fold(frames[ident]))
+            for profile, idents in wanted
+            for ident in idents
+            if ident in frames
+        ]
+        del frames
+        with _lock:
+            for profile, stack in samples:
+                profile.stacks[stack] += 1
+        time.sleep(SAMPLE_INTERVAL)
+
+
+def _start(profile: RequestProfile):
+    global _sampler
+    with _lock:
+        _active.add(profile)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="exambot-profiler", daemon=True)
+            _sampler.start()
+
+
+def _finish(profile: RequestProfile):
+    profile.duration = time.time() - profile.started
+    with _lock:
+        _active.discard(profile)
+        _recent.append(profile)
+        heapq.heappush(_slowest, (profile.duration, next(_seq), profile))
+        if len(_slowest) > PROFILE_SLOTS:
+            heapq.heappop(_slowest)
+
+
+def is_admin(token) -> bool:
+    if not ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a stage of the current request, if it is profiled. A stage running
+    on a worker thread also has that thread sampled for the request.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    ident = None if _on_event_loop() else threading.get_ident()
+    if ident is not None:
+        profile.enter_thread(ident)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.stages.append({"stage": name, "seconds": round(time.perf_counter() - start, 4)})
+        if ident is not None:
+            profile.leave_thread(ident)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that decides per request whether to profile it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(f"{scope['method']} {scope['path']}")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-exambot-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(profile)
+        _start(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current.reset(token)
+            _finish(profile)
+
+    @staticmethod
+    def _wanted(scope) -> bool:
+        headers = dict(scope.get("headers", []))
+        # forcing a profile starts the sampler thread, so only admins may
+        if headers.get(PROFILE_HEADER) == b"1":
+            admin_token = headers.get(b"x-admin-token")
+            return is_admin(admin_token.decode("latin-1") if admin_token else None)
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def slowest_profiles() -> list:
+    with _lock:
+        profiles = [profile for _, _, profile in _slowest]
+    return [p.summary() for p in sorted(profiles, key=lambda p: p.duration, reverse=True)]
+
+
+def find_profile(profile_id: str):
+    with _lock:
+        for profile in itertools.chain((p for _, _, p in _slowest), _recent):
+            if profile.id == profile_id:
+                return profile
+    return None
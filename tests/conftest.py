@@ -0,0 +1,10 @@
+import os
+import sys
+
+# backend modules live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# no real model calls are made, but yttranscriber needs a key to build the client,
+# and the tests shouldn't leave a shared cache file behind
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+os.environ["EXAMBOT_CACHE_PATH"] = ""
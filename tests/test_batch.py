@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+import backend2
+
+
+def _stub(monkeypatch):
+    extracted = []
+
+    def extract(url, cancel_event=None):
+        extracted.append(url)
+        return f"transcript of {url}"
+
+    async def answer(transcript, question):
+        if question == "bad":
+            raise RuntimeError("model refused")
+        return f"{question} from {transcript}"
+
+    monkeypatch.setattr(backend2, "get_youtube_transcript", extract)
+    monkeypatch.setattr(backend2, "answer_question", answer)
+    return extracted
+
+
+def test_batch_size_is_checked(monkeypatch):
+    extracted = _stub(monkeypatch)
+    client = TestClient(backend2.app)
+    url = "https://youtu.be/batch-size"
+
+    empty = client.post("/main/batch", json={"video_url": url, "questions": []})
+    assert empty.status_code == 400
+
+    too_many = ["q"] * (backend2.MAX_BATCH_QUESTIONS + 1)
+    oversized = client.post("/main/batch", json={"video_url": url, "questions": too_many})
+    assert oversized.status_code == 400
+    assert extracted == []
+
+
+def test_failed_question_does_not_sink_the_batch(monkeypatch):
+    extracted = _stub(monkeypatch)
+    client = TestClient(backend2.app)
+    url = "https://youtu.be/batch-partial"
+
+    response = client.post("/main/batch", json={"video_url": url, "questions": ["one", "bad", "two"]})
+    assert response.status_code == 200
+    answers = response.json()["answers"]
+    assert answers[0] == {"question": "one", "answer": f"one from transcript of {url}"}
+    assert answers[1]["question"] == "bad"
+    assert "model refused" in answers[1]["error"]
+    assert answers[2] == {"question": "two", "answer": f"two from transcript of {url}"}
+    assert extracted == [url]
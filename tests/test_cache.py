@@ -0,0 +1,67 @@
+import time
+
+import cache
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    memory = cache.MemoryCache(max_bytes=100)
+    memory.set("a", b"x" * 40)
+    memory.set("b", b"x" * 40)
+    memory.get("a")
+    memory.set("c", b"x" * 40)
+
+    assert memory.get("b") is None
+    assert memory.get("a") is not None
+    assert memory.get("c") is not None
+    assert memory._size <= 100
+
+
+def test_sqlite_tier_evicts_least_recently_used_by_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache.SQLiteCache, "EVICT_EVERY", 1)
+    disk = cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=100)
+    disk.set("a", b"x" * 40)
+    disk.set("b", b"x" * 40)
+    disk.set("c", b"x" * 40)
+
+    assert disk.get("a") is None
+    assert disk.get("b") is not None
+    assert disk.get("c") is not None
+    total = disk._conn().execute("SELECT SUM(size) FROM cache").fetchone()[0]
+    assert total <= 100
+
+
+def test_namespace_entries_expire(tmp_path, monkeypatch):
+    namespace = cache.Namespace(cache.MemoryCache(1024), "questions")
+    namespace.set("graphs", ["q1"], ttl=60)
+    assert namespace.get("graphs") == ["q1"]
+
+    real_time = time.time
+    monkeypatch.setattr(cache.time, "time", lambda: real_time() + 61)
+    assert namespace.get("graphs") is None
+    assert namespace.stats == {"hits": 1, "misses": 1}
+
+
+def test_disk_hit_backfills_memory(tmp_path):
+    memory = cache.MemoryCache(1024)
+    disk = cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024)
+    disk.set("k", b"value")
+    tiered = cache.TieredCache(memory, disk)
+
+    assert memory.get("k") is None
+    assert tiered.get("k") == b"value"
+    assert memory.get("k") == b"value"
+
+
+def test_second_worker_sees_first_workers_writes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    # each worker process has its own memory tier over the same sqlite file
+    worker_a = cache.Namespace(
+        cache.TieredCache(cache.MemoryCache(1024), cache.SQLiteCache(path, 1 << 20)), "transcripts"
+    )
+    worker_b = cache.Namespace(
+        cache.TieredCache(cache.MemoryCache(1024), cache.SQLiteCache(path, 1 << 20)), "transcripts"
+    )
+
+    worker_a.set("video-id", "the transcript")
+    assert worker_b.get("video-id") == "the transcript"
+    assert worker_b.stats["hits"] == 1
@@ -0,0 +1,328 @@
+"""
+Client disconnects must cancel the work behind /main and /finalevaluation
+and give the capacity back. The model and yt-dlp are replaced by stubs that
+never finish on their own.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import backend2
+
+
+def asgi_request(path, payload):
+    """Starts a POST against the app. Returns the task, a disconnect trigger and the sent messages."""
+    body = json.dumps(payload).encode()
+    disconnected = asyncio.Event()
+    body_sent = False
+    messages = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        if not disconnected.is_set():
+            await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    task = asyncio.ensure_future(backend2.app(scope, receive, send))
+    return task, disconnected, messages
+
+
+def status_of(messages):
+    return next(m["status"] for m in messages if m["type"] == "http.response.start")
+
+
+def json_of(messages):
+    return json.loads(b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body"))
+
+
+async def wait_for_flag(flag, timeout=5):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, flag.wait, timeout)
+    assert flag.is_set()
+
+
+class SlowModel:
+    """Stands in for a model call that hangs, noting when it starts and when it is cancelled."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.cancelled = threading.Event()
+
+    async def __call__(self, *args, **kwargs):
+        self.started.set()
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+
+
+@pytest.fixture(autouse=True)
+def fast_disconnect_polling(monkeypatch):
+    monkeypatch.setattr(backend2, "DISCONNECT_POLL_SECONDS", 0.01)
+
+
+def test_main_disconnect_cancels_model_call(monkeypatch):
+    model = SlowModel()
+    monkeypatch.setattr(backend2, "get_youtube_transcript", lambda url, cancel_event=None: "transcript")
+    monkeypatch.setattr(backend2, "answer_question", model)
+    before = backend2.metrics["cancelled_requests"]["/main"]
+
+    async def scenario():
+        task, disconnect, messages = asgi_request(
+            "/main", {"video_url": "https://youtu.be/cancel-main", "question": "why?"}
+        )
+        await wait_for_flag(model.started)
+        disconnect.set()
+        await asyncio.wait_for(task, 5)
+        return messages
+
+    messages = asyncio.run(scenario())
+
+    assert model.cancelled.is_set()
+    assert status_of(messages) == 499
+    assert backend2.metrics["cancelled_requests"]["/main"] == before + 1
+
+
+def test_finalevaluation_disconnect_cancels_report(monkeypatch):
+    model = SlowModel()
+    monkeypatch.setattr(backend2, "atotal_evaluate", model)
+    before = backend2.metrics["cancelled_requests"]["/finalevaluation"]
+
+    async def scenario():
+        task, disconnect, messages = asgi_request(
+            "/finalevaluation", {"topics": "graphs", "full_conversation": "Q: ...\nA: ..."}
+        )
+        await wait_for_flag(model.started)
+        disconnect.set()
+        await asyncio.wait_for(task, 5)
+        return messages
+
+    messages = asyncio.run(scenario())
+
+    assert model.cancelled.is_set()
+    assert status_of(messages) == 499
+    assert backend2.metrics["cancelled_requests"]["/finalevaluation"] == before + 1
+
+
+def test_disconnect_drops_queued_extraction(monkeypatch):
+    # one worker: video A holds it, video B queues behind A, then B's client leaves
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(backend2, "TRANSCRIPT_EXECUTOR", executor)
+    release_a = threading.Event()
+    a_running = threading.Event()
+    extracted = []
+
+    def blocking_extract(url, cancel_event=None):
+        extracted.append(url)
+        if url.endswith("video-a"):
+            a_running.set()
+            release_a.wait(5)
+        return f"transcript of {url}"
+
+    monkeypatch.setattr(backend2, "get_youtube_transcript", blocking_extract)
+
+    async def answer(transcript, question):
+        return f"answer from {transcript}"
+
+    monkeypatch.setattr(backend2, "answer_question", answer)
+
+    async def scenario():
+        task_a, _, messages_a = asgi_request(
+            "/main", {"video_url": "https://youtu.be/video-a", "question": "q"}
+        )
+        await wait_for_flag(a_running)
+        task_b, disconnect_b, messages_b = asgi_request(
+            "/main", {"video_url": "https://youtu.be/video-b", "question": "q"}
+        )
+        await asyncio.sleep(0.05)
+        disconnect_b.set()
+        await asyncio.wait_for(task_b, 5)
+
+        release_a.set()
+        await asyncio.wait_for(task_a, 5)
+
+        # with B dropped from the queue, C gets the worker straight after A
+        task_c, _, messages_c = asgi_request(
+            "/main", {"video_url": "https://youtu.be/video-c", "question": "q"}
+        )
+        await asyncio.wait_for(task_c, 5)
+        return messages_a, messages_b, messages_c
+
+    try:
+        messages_a, messages_b, messages_c = asyncio.run(scenario())
+    finally:
+        release_a.set()
+        executor.shutdown(wait=True)
+
+    assert status_of(messages_b) == 499
+    assert status_of(messages_a) == 200
+    assert status_of(messages_c) == 200
+    assert extracted == ["https://youtu.be/video-a", "https://youtu.be/video-c"]
+
+
+def test_cancelled_fetch_does_not_unregister_its_replacement(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(backend2, "TRANSCRIPT_EXECUTOR", executor)
+    release = threading.Event()
+
+    def blocking_extract(url, cancel_event=None):
+        release.wait(5)
+        return "transcript"
+
+    monkeypatch.setattr(backend2, "get_youtube_transcript", blocking_extract)
+    url = "https://youtu.be/replaced"
+
+    async def scenario():
+        first = backend2.start_transcript_fetch(url)
+        first.cancel()
+        second = backend2.start_transcript_fetch(url)
+        assert second is not first
+        # let the cancelled fetch's done callback run
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert backend2.inflight_transcripts[first.key] is second
+        release.set()
+        await second.future
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown(wait=True)
+
+
+class BlockingExtract:
+    """Stands in for yt-dlp: counts extractions and holds each one until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.running = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, url, cancel_event=None):
+        self.calls.append(url)
+        self.running.set()
+        self.release.wait(5)
+        return f"transcript of {url}"
+
+
+def test_main_attaches_to_inflight_prefetch(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(backend2, "TRANSCRIPT_EXECUTOR", executor)
+    extract = BlockingExtract()
+    monkeypatch.setattr(backend2, "get_youtube_transcript", extract)
+
+    async def answer(transcript, question):
+        return f"answer from {transcript}"
+
+    monkeypatch.setattr(backend2, "answer_question", answer)
+    url = "https://youtu.be/prefetched"
+
+    async def scenario():
+        task, _, prefetch_messages = asgi_request("/prefetch", {"video_url": url})
+        await asyncio.wait_for(task, 5)
+        await wait_for_flag(extract.running)
+
+        task, _, main_messages = asgi_request("/main", {"video_url": url, "question": "q"})
+        fetch = backend2.inflight_transcripts[backend2.video_cache_key(url)]
+        while fetch.waiters == 0:
+            await asyncio.sleep(0.01)
+        extract.release.set()
+        await asyncio.wait_for(task, 5)
+        return prefetch_messages, main_messages
+
+    try:
+        prefetch_messages, main_messages = asyncio.run(scenario())
+    finally:
+        extract.release.set()
+        executor.shutdown(wait=True)
+
+    assert json_of(prefetch_messages) == {"status": "pending"}
+    assert json_of(main_messages)["answer"] == f"answer from transcript of {url}"
+    assert extract.calls == [url]
+
+
+def test_prefetch_is_busy_past_the_cap(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(backend2, "TRANSCRIPT_EXECUTOR", executor)
+    monkeypatch.setattr(backend2, "MAX_PREFETCHES", 1)
+    extract = BlockingExtract()
+    monkeypatch.setattr(backend2, "get_youtube_transcript", extract)
+
+    async def prefetch(url):
+        task, _, messages = asgi_request("/prefetch", {"video_url": url})
+        await asyncio.wait_for(task, 5)
+        return json_of(messages)["status"]
+
+    async def scenario():
+        statuses = [
+            await prefetch("https://youtu.be/busy-a"),
+            await prefetch("https://youtu.be/busy-b"),
+            # the video already in flight doesn't count against the cap
+            await prefetch("https://youtu.be/busy-a"),
+        ]
+        extract.release.set()
+        for fetch in list(backend2.inflight_transcripts.values()):
+            await fetch.future
+        return statuses
+
+    try:
+        statuses = asyncio.run(scenario())
+    finally:
+        extract.release.set()
+        executor.shutdown(wait=True)
+
+    assert statuses == ["pending", "busy", "pending"]
+    assert extract.calls == ["https://youtu.be/busy-a"]
+
+
+def test_unclaimed_prefetch_is_cancelled_after_ttl(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(backend2, "TRANSCRIPT_EXECUTOR", executor)
+    monkeypatch.setattr(backend2, "PREFETCH_TTL", 0.05)
+    extract = BlockingExtract()
+    monkeypatch.setattr(backend2, "get_youtube_transcript", extract)
+    url = "https://youtu.be/unclaimed"
+
+    async def scenario():
+        task, _, _ = asgi_request("/prefetch", {"video_url": url})
+        await asyncio.wait_for(task, 5)
+        fetch = backend2.inflight_transcripts[backend2.video_cache_key(url)]
+        await asyncio.sleep(0.2)
+        return fetch
+
+    try:
+        fetch = asyncio.run(scenario())
+    finally:
+        extract.release.set()
+        executor.shutdown(wait=True)
+
+    assert fetch.cancel_event.is_set()
+    assert backend2.video_cache_key(url) not in backend2.inflight_transcripts
@@ -0,0 +1,71 @@
+import captions
+
+
+def test_language_order_is_respected():
+    info = {
+        "subtitles": {
+            "en": [{"ext": "vtt", "url": "en"}],
+            "de": [{"ext": "vtt", "url": "de"}],
+        },
+    }
+    assert captions.resolve_caption_track(info, ["de", "en"])["lang"] == "de"
+    assert captions.resolve_caption_track(info, ["en", "de"])["lang"] == "en"
+
+
+def test_manual_before_auto_and_exact_before_regional():
+    info = {
+        "subtitles": {"en-GB": [{"ext": "json3", "url": "gb"}]},
+        "automatic_captions": {
+            "en": [{"ext": "srv3", "url": "auto"}],
+            "fr": [{"ext": "srv3", "url": "translated"}],
+        },
+    }
+    ranked = captions.rank_tracks(info, ["en"])
+    assert [t["url"] for t in ranked] == ["gb", "auto"]
+
+    info["subtitles"]["en"] = [{"ext": "vtt", "url": "exact"}]
+    assert captions.resolve_caption_track(info, ["en"])["url"] == "exact"
+
+
+def test_vtt_skips_identifiers_and_note_blocks():
+    raw = (
+        "WEBVTT\n"
+        "Kind: captions\n"
+        "\n"
+        "STYLE\n"
+        "::cue { color: yellow }\n"
+        "\n"
+        "NOTE this is a comment\n"
+        "\n"
+        "1\n"
+        "00:00:01.000 --> 00:00:02.000 align:start\n"
+        "hello <c>there</c>\n"
+        "\n"
+        "2\n"
+        "00:00:02.000 --> 00:00:03.500\n"
+        "hello there\n"
+        "general kenobi\n"
+    )
+    track = {"kind": "auto", "ext": "vtt"}
+    assert captions.parse_captions(track, raw) == [(1000, "hello there"), (2000, "general kenobi")]
+
+
+def test_manual_vtt_keeps_repeated_lines():
+    raw = (
+        "WEBVTT\n"
+        "\n"
+        "00:00:01.000 --> 00:00:02.000\n"
+        "No.\n"
+        "\n"
+        "00:00:02.000 --> 00:00:03.000\n"
+        "No.\n"
+    )
+    track = {"kind": "manual", "ext": "vtt"}
+    assert captions.parse_captions(track, raw) == [(1000, "No."), (2000, "No.")]
+
+
+def test_srv3_and_json3():
+    srv3 = '<timedtext format="3"><body><p t="10" d="5"><s>hi</s><s> there</s></p></body></timedtext>'
+    assert captions.parse_srv3(srv3) == [(10, "hi there")]
+    json3 = '{"events": [{"tStartMs": 5, "segs": [{"utf8": "a"}, {"utf8": "b"}]}, {"tStartMs": 9}]}'
+    assert captions.parse_json3(json3) == [(5, "a b")]
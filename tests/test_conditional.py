@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+import backend2
+
+
+def test_notes_etag_is_weak_and_revalidates(monkeypatch):
+    async def notes(topics, focus_areas):
+        return "x" * 5000
+
+    monkeypatch.setattr(backend2, "agenerate_notes_stateless", notes)
+    client = TestClient(backend2.app)
+
+    first = client.get("/generate_notes_only", params={"topic": "graphs"},
+                       headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["content-encoding"] in ("gzip", "br")
+
+    again = client.get("/generate_notes_only", params={"topic": "graphs"},
+                       headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert again.status_code == 304
+
+    wildcard = client.get("/generate_notes_only", params={"topic": "graphs"},
+                          headers={"If-None-Match": "*"})
+    assert wildcard.status_code == 304
+
+    stale = client.get("/generate_notes_only", params={"topic": "graphs"},
+                       headers={"If-None-Match": 'W/"other"'})
+    assert stale.status_code == 200
+
+
+def test_browsers_can_read_the_etag(monkeypatch):
+    async def notes(topics, focus_areas):
+        return "notes"
+
+    monkeypatch.setattr(backend2, "agenerate_notes_stateless", notes)
+    client = TestClient(backend2.app)
+
+    response = client.get("/generate_notes_only", params={"topic": "graphs"},
+                          headers={"Origin": "https://example.com"})
+    assert "etag" in response.headers["access-control-expose-headers"].lower()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+import hedging
+
+
+def test_hedge_budget_is_over_recent_calls_only():
+    policy = hedging.HedgePolicy(max_ratio=0.1, window=100)
+    # a long quiet stretch must not bank hedges for later
+    policy.calls = 10_000
+    granted = 0
+    for _ in range(100):
+        policy.calls += 1
+        granted += policy.try_acquire()
+    assert granted == 10
+
+
+def test_timeouts_are_recorded_as_latency(monkeypatch):
+    monkeypatch.setenv("EXAMBOT_TIMEOUT_GRADING", "0.05")
+    policy = hedging.HedgePolicy(max_ratio=0.1)
+    monkeypatch.setitem(hedging.policies, "grading", policy)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    with pytest.raises(hedging.StageTimeout):
+        asyncio.run(hedging.call_with_deadline("grading", hang))
+    assert len(policy.samples) == 1
+    assert policy.samples[0] >= 0.05
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGING_ENABLED", True)
+    policy = hedging.HedgePolicy(max_ratio=0.5, min_samples=5)
+    monkeypatch.setitem(hedging.policies, "grading", policy)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        # first call hangs, the hedge comes back fast
+        await asyncio.sleep(10 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    async def scenario():
+        for _ in range(5):
+            policy.record(0.01)
+        policy.calls = 10
+        return await hedging.call_with_deadline("grading", call, hedge=True)
+
+    assert asyncio.run(scenario()) == 2
+    assert policy.hedges == 1
@@ -0,0 +1,50 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+import cache
+import notes_store
+
+
+def _stub_model(monkeypatch):
+    """Swaps the model for one that echoes what it was asked for and records each call."""
+    calls = []
+
+    def answer(prompt):
+        text = prompt.to_string()
+        calls.append(text)
+        if "DEEP DIVE" in text:
+            area = text.split("weak on: ", 1)[1].splitlines()[0]
+            return f"### {area}"
+        return "base notes"
+
+    monkeypatch.setattr(notes_store, "model", RunnableLambda(answer))
+    backend = cache.MemoryCache(1 << 20)
+    monkeypatch.setattr(notes_store, "base_notes_cache", cache.Namespace(backend, "notes_base"))
+    monkeypatch.setattr(notes_store, "section_cache", cache.Namespace(backend, "notes_sections"))
+    return calls
+
+
+def test_only_missing_sections_are_generated(monkeypatch):
+    calls = _stub_model(monkeypatch)
+
+    first = asyncio.run(notes_store.abuild_notes("Graphs", ["BFS", "DFS"]))
+    assert len(calls) == 3
+    assert "### BFS" in first and "### DFS" in first
+
+    calls.clear()
+    second = asyncio.run(notes_store.abuild_notes("graphs", ["DFS", "Dijkstra, with heaps"]))
+    # base notes and the DFS section come from the cache
+    assert len(calls) == 1
+    assert "weak on: Dijkstra, with heaps" in calls[0]
+    assert second.startswith("base notes")
+    assert "### DFS" in second and "### Dijkstra, with heaps" in second
+    assert "### BFS" not in second
+
+
+def test_placeholders_mean_base_notes_only(monkeypatch):
+    calls = _stub_model(monkeypatch)
+
+    notes = notes_store.build_notes("Graphs", [notes_store.NO_WEAK_TOPICS, notes_store.GENERAL_FOCUS, " "])
+    assert notes == "base notes"
+    assert len(calls) == 1
@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import profiler
+
+
+def blocking_work():
+    with profiler.stage("yt_dlp_extract"):
+        deadline = time.time() + 0.1
+        while time.time() < deadline:
+            sum(range(1000))
+
+
+async def stub_app(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        await loop.run_in_executor(executor, contextvars.copy_context().run, blocking_work)
+    with profiler.stage("model:qa"):
+        await asyncio.sleep(0.05)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+
+
+def run_request(headers):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/main", "headers": headers}
+    asyncio.run(profiler.ProfilingMiddleware(stub_app)(scope, None, send))
+    return dict(sent[0]["headers"])
+
+
+def test_profile_header_needs_admin_token(monkeypatch):
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiler, "PROFILE_SAMPLE_RATE", 0)
+
+    anonymous = run_request([(b"x-exambot-profile", b"1")])
+    assert b"x-exambot-profile-id" not in anonymous
+
+    wrong = run_request([(b"x-exambot-profile", b"1"), (b"x-admin-token", b"guess")])
+    assert b"x-exambot-profile-id" not in wrong
+
+    admin = run_request([(b"x-exambot-profile", b"1"), (b"x-admin-token", b"secret")])
+    assert b"x-exambot-profile-id" in admin
+
+
+def test_only_the_requests_worker_threads_are_sampled(monkeypatch):
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "secret")
+    headers = run_request([(b"x-exambot-profile", b"1"), (b"x-admin-token", b"secret")])
+    profile = profiler.find_profile(headers[b"x-exambot-profile-id"].decode())
+
+    assert [s["stage"] for s in profile.stages] == ["yt_dlp_extract", "model:qa"]
+    stacks = profile.folded()
+    assert "blocking_work" in stacks
+    # the shared event loop thread must not show up in a single request's profile
+    assert "run_forever" not in stacks
+    assert threading.main_thread().ident not in profile.threads
@@ -41,45 +41,77 @@ model = ChatGoogleGenerativeAI(model = 'gemini-2.5-flash-lite', temperature = 0.
 #         response = requests.get(sub_url)
 #         return response.text
 
-import json
 import requests
 import yt_dlp
+from captions import resolve_caption_track, parse_captions, track_ttl
+from cache import get_cache
+from profiler import stage
+
+caption_source_cache = get_cache("caption_sources")
 
 def format_time(ms):
     seconds = int(ms) / 1000
     m, s = divmod(seconds, 60)
     return f"{int(m):02d}:{int(s):02d}"
 
-def extract_youtube_transcript(video_url):
+def video_cache_key(video_url):
+    """Normalises the different YouTube URL shapes to the video id so they share a cache entry."""
+    parsed = urlparse(video_url.strip())
+    video_id = parse_qs(parsed.query).get("v", [None])[0]
+    if not video_id and parsed.netloc.endswith("youtu.be"):
+        video_id = parsed.path.lstrip("/").split("/")[0]
+    if not video_id:
+        parts = [p for p in parsed.path.split("/") if p]
+        if len(parts) >= 2 and parts[0] in ("embed", "shorts", "live", "v"):
+            video_id = parts[1]
+    return video_id or video_url.strip()
+
+
+class TranscriptCancelled(Exception):
+    """Raised when the caller gave up on a transcript before it was fetched."""
+
+
+def _fetch_caption_segments(track):
+    with stage("caption_fetch"):
+        response = requests.get(track["url"], timeout=30)
+        response.raise_for_status()
+    with stage(f"caption_parse:{track['ext']}"):
+        return parse_captions(track, response.text)
+
+def extract_youtube_transcript(video_url, cancel_event=None):
+    key = video_cache_key(video_url)
+
+    # a previously resolved track lets us skip yt-dlp entirely until its
+    # signed URL expires
+    track = caption_source_cache.get(key)
+    if track is not None:
+        try:
+            segments = _fetch_caption_segments(track)
+            return " ".join(text for _, text in segments)
+        except Exception:
+            caption_source_cache.delete(key)
+
     ydl_opts = {
         "skip_download": True,
-        "writesubtitles": True,
-        "writeautomaticsub": True,
-        "subtitleslangs": ["en"],
         "quiet": True
     }
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with stage("yt_dlp_extract"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
         info = ydl.extract_info(video_url, download=False)
 
-        if "subtitles" in info and "en" in info["subtitles"]:
-            sub_url = info["subtitles"]["en"][0]["url"]
-        elif "automatic_captions" in info and "en" in info["automatic_captions"]:
-            sub_url = info["automatic_captions"]["en"][0]["url"]
-        else:
-            raise ValueError("No English subtitles found")
+    track = resolve_caption_track(info)
 
-        raw_caption = requests.get(sub_url).text
-        data = json.loads(raw_caption)
+    # yt-dlp can't be interrupted mid-extraction, so this is the first
+    # point where we can stop if the request that wanted this went away
+    if cancel_event is not None and cancel_event.is_set():
+        raise TranscriptCancelled(video_url)
 
-        transcript = []
-        for event in data.get("events", []):
-            for seg in event.get("segs", []):
-                text = seg.get("utf8", "").strip()
-                if text:
-                    transcript.append(text)
+    segments = _fetch_caption_segments(track)
+    ttl = track_ttl(track)
+    if ttl > 0:
+        caption_source_cache.set(key, track, ttl=ttl)
 
-        return " ".join(transcript)
+    return " ".join(text for _, text in segments)
 
 
 
@@ -91,13 +123,14 @@ def extract_youtube_transcript(video_url):
 #     transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=["en"])
 #     return " ".join(chunk["text"] for chunk in transcript)
 
+QA_PROMPT = PromptTemplate.from_template(
+    template = """ you are a helpful assitant who can answer the questions of the user :{question}, from the given transcript thats extracted 
+            from a youtube video:{transcription_text}, answer any questions in bullet poitns and a little summary and a little intro and end with summary or outro and make sure to include bullet points """
+)
+
 def ask_questions(transcription_text,question):
     try:
-        prompt = PromptTemplate.from_template(
-            template = """ you are a helpful assitant who can answer the questions of the user :{question}, from the given transcript thats extracted 
-            from a youtube video:{transcription_text}, answer any questions in bullet poitns and a little summary and a little intro and end with summary or outro and make sure to include bullet points """
-        )
-        chain = prompt | model | StrOutputParser()
+        chain = QA_PROMPT | model | StrOutputParser()
         response = chain.invoke({
             'question':question,
             'transcription_text':transcription_text
@@ -107,6 +140,15 @@ def ask_questions(transcription_text,question):
     except Exception as e:
         return f'exeection occured {e}'
 
+async def aask_questions(transcription_text, question):
+    """Async version of ask_questions. Raises instead of returning the error text,
+    and cancelling the awaiting task aborts the model call."""
+    chain = QA_PROMPT | model | StrOutputParser()
+    return await chain.ainvoke({
+        'question': question,
+        'transcription_text': transcription_text
+    })
+
 def main():
     video_url = input('Please enter your video url:- ')
     transcription_text=''